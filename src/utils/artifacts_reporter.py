@@ -15,12 +15,14 @@ import numpy as np
 import src.utils.io as io
 
 EXTENSION = 1
+RUNS_DIM = 0
 
 
 def collect_artifacts_report(*,
                              experiments_path: str,
                              dest_path: str,
-                             filename: str = None):
+                             filename: str = None,
+                             n_workers: int = 1):
     """
     Collect the artifacts report based on the experiment runs
     placed in the "experiments_path" directory.
@@ -31,26 +33,41 @@ def collect_artifacts_report(*,
         full path to the report .csv file.
     :param filename: Name of the file holding metrics.
         Defaults to 'inference_metrics.csv'.
+    :param n_workers: Number of threads loading the metric files of
+        the experiment runs concurrently.
     """
-    all_metrics = io.load_metrics(experiments_path, filename)
-    metric_keys = {tuple(metric_keys)
-                      for metric_keys in all_metrics['metric_keys']}
-    if len(metric_keys) != 1:
+    all_metrics = io.load_metrics(experiments_path, filename, n_workers)
+    if not all_metrics['metric_keys']:
+        raise AssertionError('No experiment runs found in {}.'.format(experiments_path))
+    metric_keys = all_metrics['metric_keys'][0]
+    if not all(keys == metric_keys for keys in all_metrics['metric_keys']):
         raise AssertionError('The metric names should be consistent across all experiment runs.')
-    artifacts = {metric_key: [] for metric_key in next(iter(metric_keys))}
+    metric_values = np.asarray(all_metrics['metric_values'], dtype=np.float64)
 
-    for metric_values in all_metrics['metric_values']:
-        for metric_key, metric_value in zip(artifacts.keys(), metric_values):
-            artifacts[metric_key].append(float(metric_value))
+    stats = _column_stats(metric_values)
 
     stat_report = {'Stats': ['mean', 'std', 'min', 'max']}
-    for key in artifacts.keys():
-        stat_report[key] = [
-            np.mean(artifacts[key]), np.std(artifacts[key]),
-            np.min(artifacts[key]), np.max(artifacts[key])
-        ]
+    stat_report.update(zip(metric_keys, stats.T.tolist()))
     if len(os.path.splitext(dest_path)[EXTENSION]) != 0:
         io.save_metrics(dest_path, stat_report)
     else:
         os.makedirs(dest_path, exist_ok=True)
         io.save_metrics(dest_path, stat_report, 'report.csv')
+
+
+def _column_stats(values: np.ndarray) -> np.ndarray:
+    """
+    Compute the mean, std, min and max of each metric column.
+
+    :param values: Metric values with dimensions [RUNS, METRICS].
+    :return: Array with dimensions [4, METRICS] holding the mean, std,
+        min and max rows.
+    """
+    n_runs = values.shape[RUNS_DIM]
+    stats = np.empty((4, values.shape[1]), dtype=np.float64)
+    values.mean(RUNS_DIM, out=stats[0])
+    deviations = values - stats[0]
+    np.sqrt(np.square(deviations).sum(RUNS_DIM) / n_runs, out=stats[1])
+    values.min(RUNS_DIM, out=stats[2])
+    values.max(RUNS_DIM, out=stats[3])
+    return stats
@@ -11,6 +11,7 @@ Created on Jan 29, 2021
 import os
 import csv
 import glob
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from typing import Dict, List, Tuple
 
@@ -19,34 +20,46 @@ import src.model.enums as enums
 UNMIXING_CLASS_FRACTIONS = 0
 
 
-def load_metrics(experiments_path: str, filename: str = None) -> Dict[
-    List, List]:
+def load_metrics(experiments_path: str, filename: str = None,
+                 n_workers: int = 1) -> Dict[List, List]:
     """
     Load metrics to a dictionary.
 
     :param experiments_path: Path to the experiments directory.
     :param filename: Name of the file holding metrics. Defaults to
         'inference_metrics.csv'.
+    :param n_workers: Number of threads reading the metric files
+        concurrently.
     :return: Dictionary containing all metric names and
         values from all experiments.
     """
-    all_metrics = {'metric_keys': [], 'metric_values': []}
-    for experiment_dir in glob.glob(
+    if filename is None:
+        filename = enums.Experiment.INFERENCE_METRICS
+    metric_paths = [
+        os.path.join(experiment_dir, filename)
+        for experiment_dir in glob.glob(
             os.path.join(experiments_path,
-                         '{}*'.format(enums.Experiment.EXPERIMENT))):
-        if filename is None:
-            inference_metrics_path = os.path.join(
-                experiment_dir,
-                enums.Experiment.INFERENCE_METRICS)
-        else:
-            inference_metrics_path = os.path.join(experiment_dir, filename)
-        with open(inference_metrics_path) as metric_file:
-            reader = csv.reader(metric_file, delimiter=',')
-            for row, key in zip(reader, all_metrics.keys()):
+                         '{}*'.format(enums.Experiment.EXPERIMENT)))]
+    all_metrics = {'metric_keys': [], 'metric_values': []}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for rows in executor.map(_read_metric_rows, metric_paths):
+            for row, key in zip(rows, all_metrics.keys()):
                 all_metrics[key].append(row)
     return all_metrics
 
 
+def _read_metric_rows(metrics_path: str) -> List[List[str]]:
+    """
+    Read the metric names and values rows of a single experiment.
+
+    :param metrics_path: Path to the metrics .csv file.
+    :return: List with the names row followed by the values row.
+    """
+    with open(metrics_path) as metric_file:
+        reader = csv.reader(metric_file, delimiter=',')
+        return [row for row, _ in zip(reader, range(2))]
+
+
 def save_metrics(dest_path: str, metrics: Dict[str, List],
                  file_name: str = None):
     """
@@ -50,8 +50,7 @@ def main(*,
     train_size = utils.parse_train_size(train_size)
     data, labels = io.load_npy(data_file_path, ground_truth_path)
 
-    data, labels = preprocessing.reshape_cube_to_1d_samples(data, labels, channels_idx)
-    data, labels = preprocessing.remove_nan_samples(data, labels)
+    data, labels = preprocessing.preprocess_pipeline(data, labels, channels_idx)
 
     train_x, train_y, val_x, val_y, test_x, test_y = \
         preprocessing.train_val_test_split(data, labels, train_size, val_size, seed)
@@ -8,42 +8,154 @@ Created on Jan 29, 2021
 @author: laugh12321
 @contact: laugh12321@vip.qq.com
 """
-import functools
 import numpy as np
 from typing import Tuple, Union, List
 
-from src.utils.utils import shuffle_arrays_together, get_label_indices_per_class
+from src.utils.utils import get_class_slices
 
 HEIGHT = 0
 WIDTH = 1
 DEPTH = 2
+SAMPLES_DIM = 0
+NAN_SCAN_BLOCK = 16384
+PIPELINE_BLOCK = 2048
 
 
 def reshape_cube_to_1d_samples(data: np.ndarray,
                                labels: np.ndarray,
-                               channels_idx: int = 0) -> \
+                               channels_idx: int = 0,
+                               dtype: np.dtype = np.float32) -> \
         Tuple[np.ndarray, np.ndarray]:
     """
     Reshape the data and labels from [CHANNELS, HEIGHT, WIDTH] to
         [PIXEL,CHANNELS, 1], so it fits the 2D Convolutional modules.
 
     :param data: Data to reshape.
-    :param labels: Corresponding labels.
+    :param labels: Corresponding labels. These are per-pixel abundance
+        fractions, so they stay float32, an integer type would truncate them.
     :param channels_idx: Index at which the channels are located in the
                          provided data file.
+    :param dtype: Floating type of the reshaped data, e.g. np.float16 to
+        halve the memory footprint of large cubes. Nan values are preserved,
+        so remove_nan_samples works on any of them.
     :return: Reshape data and labels
     :rtype: tuple with reshaped data and labels
+    :raises AssertionError: When the data does not fit in the range of dtype
+    """
+    if channels_idx % data.ndim == DEPTH:
+        return _reshape_channels_last(data, labels, dtype)
+    return _reshape_channels_last(
+        np.moveaxis(data, channels_idx, -1), labels, dtype)
+
+
+def _reshape_channels_last(data: np.ndarray,
+                           labels: np.ndarray,
+                           dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reshape the data from [HEIGHT, WIDTH, CHANNELS] to [PIXEL, CHANNELS].
+    Already C-ordered data of the requested dtype is reshaped without
+    any copy.
+
+    :param data: Data with the channels as the last axis.
+    :param labels: Corresponding labels.
+    :param dtype: Floating type of the reshaped data.
+    :return: Reshaped data and labels
     """
-    data = np.rollaxis(data, channels_idx, len(data.shape))
     height, width, channels = data.shape
-    data = data.reshape(height * width, channels)
-    labels = labels.reshape(height * width, -1)
-    data = data.astype(np.float32)
-    labels = labels.astype(np.float32)
+    _check_dtype_range(data, dtype)
+    data = np.require(data, dtype=dtype, requirements=['C']).reshape(
+        height * width, channels)
+    labels = np.require(labels, dtype=np.float32, requirements=['C']).reshape(
+        height * width, -1)
 
     return data, labels
 
 
+def preprocess_pipeline(data: np.ndarray,
+                        labels: np.ndarray,
+                        channels_idx: int = 0,
+                        dtype: np.dtype = np.float32,
+                        block_size: int = PIPELINE_BLOCK) -> \
+        Tuple[np.ndarray, np.ndarray]:
+    """
+    Reshape the data and labels to [PIXEL, CHANNELS] and remove samples
+    containing nan values in a single pass. The cube is processed in blocks
+    of image rows which fit in the cache. Each block is moved and cast
+    straight into the output and checked for nans there, only blocks
+    holding nans are compacted.
+
+    :param data: Data to reshape.
+    :param labels: Corresponding labels.
+    :param channels_idx: Index at which the channels are located in the
+                         provided data file.
+    :param dtype: Floating type of the reshaped data.
+    :param block_size: Approximate number of samples processed at once.
+    :return: Reshaped data and labels with removed samples containing nans
+    :raises AssertionError: When the data does not fit in the range of dtype
+    """
+    data = np.moveaxis(data, channels_idx, -1)
+    height, width, channels = data.shape
+    _check_dtype_range(data, dtype)
+    labels = labels.reshape(height, width, -1)
+    reshaped_data = np.empty((height * width, channels), dtype=dtype)
+    reshaped_labels = np.empty((height * width, labels.shape[DEPTH]),
+                               dtype=np.float32)
+    rows_per_block = max(1, block_size // width)
+    n_kept = 0
+    for row in range(0, height, rows_per_block):
+        data_rows = data[row:row + rows_per_block]
+        label_rows = labels[row:row + rows_per_block]
+        n_block = data_rows.shape[HEIGHT] * width
+        data_block = reshaped_data[n_kept:n_kept + n_block]
+        label_block = reshaped_labels[n_kept:n_kept + n_block]
+        data_block.reshape(data_rows.shape)[...] = data_rows
+        label_block.reshape(label_rows.shape)[...] = label_rows
+        nan_samples = _nan_mask(data_block, n_block)
+        if nan_samples.any():
+            keep = ~nan_samples
+            n_block = np.count_nonzero(keep)
+            data_block[:n_block] = data_block[keep]
+            label_block[:n_block] = label_block[keep]
+        n_kept += n_block
+    if n_kept < len(reshaped_data):
+        # Release the block views, so the buffers can be shrunk in place.
+        del data_block, label_block
+        reshaped_data.resize((n_kept, channels))
+        reshaped_labels.resize((n_kept, labels.shape[DEPTH]))
+    return reshaped_data, reshaped_labels
+
+
+def _check_dtype_range(data: np.ndarray, dtype: np.dtype) -> None:
+    """
+    Check whether the data can be cast to a floating type narrower than
+    float32 without overflowing. The data is only scanned when the range
+    of its own type does not already fit. Non-finite values are ignored,
+    as they keep their value in any floating type.
+
+    :param data: Data to be cast.
+    :param dtype: Target floating type.
+    :raises AssertionError: When the data does not fit in the range of dtype
+    """
+    dtype = np.dtype(dtype)
+    if dtype.itemsize >= np.dtype(np.float32).itemsize or data.size == 0:
+        return
+    dtype_max = float(np.finfo(dtype).max)
+    if np.issubdtype(data.dtype, np.integer):
+        data_range = np.iinfo(data.dtype)
+        if -dtype_max <= data_range.min and data_range.max <= dtype_max:
+            return
+        min_value, max_value = data.min(), data.max()
+    else:
+        if data.dtype.itemsize <= dtype.itemsize:
+            return
+        finite = np.isfinite(data)
+        min_value = np.min(data, initial=np.inf, where=finite)
+        max_value = np.max(data, initial=-np.inf, where=finite)
+    if min_value < -dtype_max or dtype_max < max_value:
+        raise AssertionError('The data exceeds the range of {}.'.format(
+            dtype.name))
+
+
 def remove_nan_samples(data: np.ndarray, labels: np.ndarray) -> Tuple[
     np.ndarray, np.ndarray]:
     """
@@ -53,13 +165,33 @@ def remove_nan_samples(data: np.ndarray, labels: np.ndarray) -> Tuple[
     :param labels: Corresponding labels
     :return: Data and labels with removed samples containing nans
     """
-    all_but_samples_axes = tuple(range(1, data.ndim))
-    nan_samples_indexes = np.isnan(data).any(axis=all_but_samples_axes).ravel()
+    if data.strides[SAMPLES_DIM] < max(data.strides):
+        data = np.ascontiguousarray(data)
+    nan_samples_indexes = _nan_mask(
+        data.reshape(len(data), int(np.prod(data.shape[1:]))))
     labels = labels[~nan_samples_indexes]
     data = data[~nan_samples_indexes]
     return data, labels
 
 
+def _nan_mask(samples: np.ndarray,
+              block_size: int = NAN_SCAN_BLOCK) -> np.ndarray:
+    """
+    Mark samples containing at least one nan value. The samples are
+    scanned in blocks, so the temporary boolean array never grows beyond
+    block_size rows instead of matching the size of the whole data.
+
+    :param samples: Data with dimensions [SAMPLES, FEATURES]
+    :param block_size: Number of samples checked at once
+    :return: Boolean vector, True for samples containing nans
+    """
+    mask = np.empty(samples.shape[SAMPLES_DIM], dtype=bool)
+    for start in range(0, samples.shape[SAMPLES_DIM], block_size):
+        block = samples[start:start + block_size]
+        np.isnan(block).any(axis=1, out=mask[start:start + block_size])
+    return mask
+
+
 def train_val_test_split(data: np.ndarray, labels: np.ndarray,
                          train_size: Union[List, float, int] = 0.8,
                          val_size: float = 0.1,
@@ -81,21 +213,39 @@ def train_val_test_split(data: np.ndarray, labels: np.ndarray,
     :param val_size: Should be between 0.0 and 1.0. Represents the percentage
                      of each class from the training set to be extracted as a
                      validation set, defaults to 0.1
-    :param seed: Seed used for data shuffling
+    :param seed: Seed used for data shuffling. The passed arrays are not
+        reordered, only a permutation of sample indices is drawn
     :return: train_x, train_y, val_x, val_y, test_x, test_y
     :raises AssertionError: When wrong type is passed as train_size
     """
-    shuffle_arrays_together([data, labels], seed=seed)
-    train_indices = _get_set_indices(train_size, labels)
-    val_indices = _get_set_indices(val_size, labels[train_indices])
+    if len(data) != len(labels):
+        raise AssertionError
+    permutation = np.random.RandomState(seed).permutation(len(labels))
+    shuffled_labels = labels[permutation]
+    train_indices = _get_set_indices(train_size, shuffled_labels)
+    val_indices = _get_set_indices(val_size, shuffled_labels[train_indices])
     val_indices = train_indices[val_indices]
-    test_indices = np.setdiff1d(np.arange(len(data)), train_indices)
-    train_indices = np.setdiff1d(train_indices, val_indices)
+    if isinstance(train_size, list) or isinstance(val_size, list):
+        train_mask = np.zeros(len(data), dtype=bool)
+        train_mask[train_indices] = True
+        val_mask = np.zeros_like(train_mask)
+        val_mask[val_indices] = True
+        test_mask = ~train_mask
+        train_mask &= ~val_mask
+        train_indices = permutation[train_mask]
+        val_indices = permutation[val_mask]
+        test_indices = permutation[test_mask]
+    else:
+        # Both sets are prefixes of the shuffled order, so each subset is
+        # a slice of the permutation.
+        n_train, n_val = len(train_indices), len(val_indices)
+        train_indices = permutation[n_val:n_train]
+        val_indices = permutation[:n_val]
+        test_indices = permutation[n_train:]
     return data[train_indices], labels[train_indices], data[val_indices], \
            labels[val_indices], data[test_indices], labels[test_indices]
 
 
-@functools.singledispatch
 def _get_set_indices(size: Union[List, float, int],
                      labels: np.ndarray) -> np.ndarray:
     """
@@ -117,36 +267,39 @@ def _get_set_indices(size: Union[List, float, int],
     :return: Indexes of the train set
     :raises TypeError: When wrong type is passed as size
     """
-    raise NotImplementedError()
-
-
-@_get_set_indices.register(float)
-def _(size: float, labels: np.ndarray) -> np.ndarray:
-    if not 0 < size <= 1:
-        raise AssertionError
-    train_indices = np.arange(int(len(labels) * size))
-
-    return train_indices
-
-
-@_get_set_indices.register(int)
-def _(size: int, labels: np.ndarray) -> np.ndarray:
-    if size < 1:
-        raise AssertionError
-    train_indices = np.arange(size, dtype=int)
+    if isinstance(size, float):
+        if not 0 < size <= 1:
+            raise AssertionError
+        return np.arange(int(len(labels) * size))
+    if isinstance(size, int):
+        if size < 1:
+            raise AssertionError
+        return np.arange(size, dtype=int)
+    if isinstance(size, list):
+        return _get_stratified_set_indices(size, labels)
+    raise TypeError('Unsupported size type: {}'.format(type(size).__name__))
 
-    return train_indices
 
+def _get_stratified_set_indices(size: List,
+                                labels: np.ndarray) -> np.ndarray:
+    """
+    Extract indices of the first samples of each class.
 
-@_get_set_indices.register(list)
-def _(size: List,
-      labels: np.ndarray,
-      _) -> np.ndarray:
-    label_indices, unique_labels = get_label_indices_per_class(
-        labels, return_uniques=True)
+    :param size: Number of samples to be drawn from each class. A single
+        element list applies the same number to all classes.
+    :param labels: Vector with corresponding labels
+    :return: Indexes of the set, grouped by class
+    """
+    order, starts, class_counts = get_class_slices(labels)
+    sizes = class_counts.copy()
     if len(size) == 1:
-        size = int(size[0])
-    for n_samples, label in zip(size, range(len(unique_labels))):
-        label_indices[label] = label_indices[label][:int(n_samples)]
-    train_indices = np.concatenate(label_indices, axis=0)
+        sizes = np.minimum(int(size[0]), class_counts)
+    else:
+        n_sized = min(len(size), len(class_counts))
+        sizes[:n_sized] = np.minimum(
+            np.asarray(size[:n_sized], dtype=np.int64),
+            class_counts[:n_sized])
+    set_starts = np.cumsum(sizes) - sizes
+    positions = np.arange(sizes.sum()) + np.repeat(starts - set_starts, sizes)
+    train_indices = order[positions]
     return train_indices
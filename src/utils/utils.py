@@ -135,6 +135,29 @@ def parse_train_size(train_size: List) -> Union[float, int, List[int]]:
     return list(map(int, train_size))
 
 
+def get_class_slices(labels, return_uniques: bool = False):
+    """
+    Sort the sample indices by class once, so that the indices of class c
+    are order[starts[c]:starts[c] + counts[c]]. For labels with more than
+    one value per sample, the sample is listed under every class it holds.
+    :param labels: Data labels with dimensions [SAMPLES, ...]
+    :param return_uniques: Whether to return unique labels contained in
+        labels arg
+    :return: Stably sorted sample indices, start offset and number of
+        samples of each class
+    """
+    labels = np.asarray(labels)
+    unique_labels, label_ids = np.unique(labels.ravel(), return_inverse=True)
+    counts = np.bincount(label_ids, minlength=len(unique_labels))
+    starts = np.cumsum(counts) - counts
+    order = np.argsort(label_ids, kind='stable')
+    if labels.ndim > 1:
+        order //= int(np.prod(labels.shape[1:]))
+    if return_uniques:
+        return order, starts, counts, unique_labels
+    return order, starts, counts
+
+
 def get_label_indices_per_class(labels, return_uniques: bool = True):
     """
     Extract indices of each class
@@ -143,8 +166,10 @@ def get_label_indices_per_class(labels, return_uniques: bool = True):
         labels arg
     :return: List with lists of label indices of consecutive labels
     """
-    unique_labels = np.unique(labels)
-    label_indices = [np.where(labels == label)[0] for label in unique_labels]
+    order, starts, counts, unique_labels = get_class_slices(
+        labels, return_uniques=True)
+    label_indices = [order[start:start + count]
+                     for start, count in zip(starts, counts)]
     if return_uniques:
         return label_indices, unique_labels
     return label_indices